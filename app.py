@@ -2,8 +2,17 @@ import streamlit as st
 import chromadb
 from chromadb.utils import embedding_functions
 import anthropic
-import json
+import httpx
+import orjson
+import pyarrow as pa
+import pyarrow.json as paj
 import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 st.set_page_config(page_title="ERS RAG System", page_icon="📊", layout="wide")
 
@@ -30,103 +39,323 @@ st.markdown("Ask questions about ERS documents powered by Claude AI")
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
+# Question count and source names of the last 5 answers, kept as messages are added
+if 'q_count' not in st.session_state:
+    st.session_state.q_count = 0
+    st.session_state.recent_sources = deque(maxlen=5)
+
+def iter_jsonl_lines(path, block_size=1 << 20):
+    """Yield raw byte lines of a JSONL file, read in 1 MB blocks"""
+    with open(path, "rb", buffering=block_size) as f:
+        tail = b""
+        while block := f.read(block_size):
+            lines = (tail + block).split(b"\n")
+            tail = lines.pop()
+            yield from lines
+        if tail:
+            yield tail
+
+def read_jsonl_columns(path, *names):
+    """Named columns ("metadata.source" etc.) of a JSONL file as lists, None where absent"""
+    # pyarrow parses in native code; files it rejects or whose columns it
+    # retypes (mixed or float values) go through orjson line by line
+    try:
+        table = paj.read_json(path, read_options=paj.ReadOptions(block_size=1 << 20)).flatten()
+        columns = [table.column(name) if name in table.column_names else None for name in names]
+        if all(column is None or pa.types.is_string(column.type) or pa.types.is_integer(column.type) or pa.types.is_null(column.type) for column in columns):
+            return [
+                column.to_pylist() if column is not None else [None] * table.num_rows
+                for column in columns
+            ]
+    except pa.ArrowInvalid:
+        pass
+    
+    paths = [name.split(".") for name in names]
+    columns = [[] for _ in names]
+    for line in iter_jsonl_lines(path):
+        if not line.strip():
+            continue
+        row = orjson.loads(line)
+        for keys, column in zip(paths, columns):
+            value = row
+            for key in keys:
+                value = value.get(key) if isinstance(value, dict) else None
+            column.append(value)
+    return columns
+
+# CACHE EMBEDDER - LOAD THE ONNX MODEL ONCE PER PROCESS
+@st.cache_resource
+def get_embedder():
+    """Shared all-MiniLM-L6-v2 embedding function"""
+    return embedding_functions.DefaultEmbeddingFunction()
+
+# ONE BUILD THREAD PER PROCESS
+@st.cache_resource
+def get_build_executor():
+    """Single-worker pool that runs the chunks.jsonl ingest off the script thread"""
+    return ThreadPoolExecutor(max_workers=1)
+
 # CACHE COLLECTION - BUILD ONCE
 @st.cache_resource
-def build_and_load_database():
-    """Build database from chunks.jsonl on first run"""
+def get_database_build():
+    """Load the database, or start building it from chunks.jsonl on the build thread"""
     
     database_path = "./chroma_data"
     collection_name = "ers_documents"
+    sources_path = os.path.join(database_path, "sources.json")
+    
+    # Bump when the collection settings or stored chunk schema below change
+    index_version = "5"
+    
+    # Sentinel written after a successful build: the settings version and the
+    # chunks.jsonl it was built from. A match means the database is current.
+    sentinel_path = os.path.join(database_path, ".built.json")
+    try:
+        with open(sentinel_path, "rb") as f:
+            built = orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        built = {}
+    try:
+        src_stat = os.stat("chunks.jsonl")
+        source_changed = (built.get("src_mtime"), built.get("src_size")) != (src_stat.st_mtime_ns, src_stat.st_size)
+    except FileNotFoundError:
+        # Nothing to rebuild from - keep whatever was built
+        src_stat = None
+        source_changed = False
+    is_current = built.get("index_version") == index_version and not source_changed
+    
+    def warm_up(collection):
+        # Load the ONNX model and HNSW index in the background
+        def query():
+            try:
+                collection.query(query_texts=["warmup"], n_results=1)
+            except Exception:
+                pass
+        get_build_executor().submit(query)
     
-    # Check if already built
-    if database_path and __import__('os').path.exists(database_path):
+    # A leftover directory without the sqlite file is not a usable database
+    database_exists = os.path.isdir(database_path) and os.path.isfile(os.path.join(database_path, "chroma.sqlite3"))
+    
+    # One embedder + client for both the load and the build path
+    embed = get_embedder()
+    
+    # A Chroma server (`chroma run --path ./chroma_data --port 8000`) lets
+    # concurrent sessions query without sharing in-process sqlite locks
+    chroma_host = os.environ.get("CHROMA_HOST")
+    if chroma_host:
+        client = chromadb.HttpClient(
+            host=chroma_host,
+            port=int(os.environ.get("CHROMA_PORT", "8000"))
+        )
+    else:
+        client = chromadb.PersistentClient(path=database_path)
+    
+    # Check if already built from the current chunks.jsonl and settings
+    if is_current and (database_exists or chroma_host):
         st.write("📦 Loading existing database...")
         try:
-            embed = embedding_functions.DefaultEmbeddingFunction()
-            client = chromadb.PersistentClient(path=database_path)
             collection = client.get_collection(name=collection_name, embedding_function=embed)
+            warm_up(collection)
             st.write("✅ Database loaded!")
-            return collection
-        except:
-            st.write("Rebuilding database...")
+            loaded = Future()
+            loaded.set_result((collection, None))
+            return loaded, {"percent": 100}
+        except (ValueError, RuntimeError) as e:
+            st.write(f"Rebuilding database (could not load it: {e})...")
+    elif database_exists:
+        st.write("chunks.jsonl or index settings changed, rebuilding database...")
     
     # Build from chunks.jsonl
-    st.write("🔨 Building database from chunks...")
-    
-    if not __import__('os').path.exists("chunks.jsonl"):
+    if not os.path.exists("chunks.jsonl"):
         st.error("chunks.jsonl not found!")
         st.stop()
     
-    # Create database
-    embed = embedding_functions.DefaultEmbeddingFunction()
-    client = chromadb.PersistentClient(path=database_path)
+    # HNSW params and the stored metadata schema are fixed once written -
+    # reuse only a matching collection, drop anything else
+    hnsw_metadata = {
+        "hnsw:space": "cosine",
+        "hnsw:construction_ef": 128,
+        "hnsw:M": 24,
+        "hnsw:search_ef": 100,
+        "ers:schema": 3
+    }
+    try:
+        if client.get_collection(name=collection_name).metadata != hnsw_metadata:
+            client.delete_collection(name=collection_name)
+    except ValueError:
+        pass
+    
     collection = client.get_or_create_collection(
         name=collection_name,
         embedding_function=embed,
-        metadata={"hnsw:space": "cosine"}
+        metadata=hnsw_metadata
     )
     
-    # Read chunks.jsonl and add to database
-    total_chunks = 0
-    batch_ids = []
-    batch_docs = []
-    batch_metas = []
-    batch_size = 50
-    
-    with open("chunks.jsonl", "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            
-            chunk = json.loads(line)
-            content = chunk.get("content", "")
-            meta = chunk.get("metadata", {})
-            
-            # Create ID
-            src = str(meta.get("source", ""))
-            page = str(meta.get("page", ""))
-            typ = str(meta.get("type", ""))
-            h = hashlib.sha1(content[:400].encode("utf-8")).hexdigest()
-            chunk_id = f"{src}|p{page}|{typ}|{h}"
-            
-            batch_ids.append(chunk_id)
-            batch_docs.append(content)
-            batch_metas.append(meta)
-            
-            total_chunks += 1
+    # IDs embed a hash of the whole content, so chunks already stored (e.g. by
+    # an interrupted build) are skipped instead of re-embedded
+    existing_ids = set(collection.get(include=[])["ids"])
+    
+    # Percent of chunks.jsonl rows written, read by build_and_load_database
+    progress = {"percent": 0}
+    
+    def ingest():
+        # Runs on the build thread - no st.* calls in here
+        total_chunks = 0
+        sources_set = set()
+        seen_ids = set()
+        batch_size = int(os.environ.get("CHROMA_ADD_BATCH", "250"))
+        batch_ids = [None] * batch_size
+        batch_docs = [None] * batch_size
+        batch_metas = [None] * batch_size
+        n = 0
+        
+        # Batch being embedded, not yet written to Chroma
+        pending = None
+        
+        def write(batch):
+            # Upsert keeps a resumed build idempotent
+            ids, docs, metas, embedded, row = batch
+            collection.upsert(ids=ids, documents=docs, metadatas=metas, embeddings=embedded.result())
+            progress["percent"] = row * 100 // len(contents)
+        
+        def flush(n, row):
+            # Embed on the embed thread while the previous batch is written
+            nonlocal pending
+            batch = (batch_ids[:n], batch_docs[:n], batch_metas[:n], embed_pool.submit(embed, batch_docs[:n]), row)
+            if pending is not None:
+                write(pending)
+            pending = batch
+        
+        with ThreadPoolExecutor(max_workers=1) as embed_pool:
+            contents, srcs, pages, types = read_jsonl_columns(
+                "chunks.jsonl", "content", "metadata.source", "metadata.page", "metadata.type"
+            )
+            for row, (content, src, page, typ) in enumerate(zip(contents, srcs, pages, types), 1):
+                content = content or ""
+                
+                # Create ID
+                src = "" if src is None else str(src)
+                typ = "" if typ is None else str(typ)
+                h = hashlib.blake2b(content.encode("utf-8"), digest_size=10).hexdigest()
+                chunk_id = f"{src}|p{'' if page is None else page}|{typ}|{h}"
+                
+                # Skip repeated chunks - duplicate IDs in one batch make Chroma error
+                if chunk_id in seen_ids:
+                    continue
+                seen_ids.add(chunk_id)
+                
+                # Slim metadata - only the fields that are set, page as an int
+                meta = {}
+                if src:
+                    meta["source"] = src
+                    sources_set.add(src)
+                try:
+                    meta["page"] = int(page)
+                except (TypeError, ValueError):
+                    pass
+                if typ:
+                    meta["type"] = typ
+                
+                total_chunks += 1
+                
+                if chunk_id in existing_ids:
+                    continue
+                
+                batch_ids[n] = chunk_id
+                batch_docs[n] = content
+                batch_metas[n] = meta or None
+                n += 1
+                
+                # Embed + add in batches (slots are reused, no list rebuild per flush)
+                if n >= batch_size:
+                    flush(n, row)
+                    n = 0
             
-            # Add in batches
-            if len(batch_ids) >= batch_size:
-                collection.add(ids=batch_ids, documents=batch_docs, metadatas=batch_metas)
-                batch_ids = []
-                batch_docs = []
-                batch_metas = []
-    
-    # Add remaining
-    if batch_ids:
-        collection.add(ids=batch_ids, documents=batch_docs, metadatas=batch_metas)
-    
-    st.write(f"✅ Database ready! Added {total_chunks} chunks")
-    return collection
+            # Add remaining
+            if n:
+                flush(n, len(contents))
+            if pending is not None:
+                write(pending)
+        
+        # Drop chunks that are no longer in chunks.jsonl
+        stale_ids = list(existing_ids - seen_ids)
+        if stale_ids:
+            collection.delete(ids=stale_ids)
+        
+        return total_chunks, sources_set
+    
+    def build():
+        total_chunks, sources_set = ingest()
+        
+        # Save sources so warm loads can fill the sidebar without reading chunks.jsonl
+        # (in server mode the local directory is not created by the client)
+        os.makedirs(database_path, exist_ok=True)
+        with open(sources_path, "wb") as f:
+            f.write(orjson.dumps(sorted(sources_set)))
+        
+        with open(sentinel_path, "wb") as f:
+            f.write(orjson.dumps({
+                "index_version": index_version,
+                "src_mtime": src_stat.st_mtime_ns,
+                "src_size": src_stat.st_size,
+                "count": total_chunks
+            }))
+        
+        warm_up(collection)
+        return collection, total_chunks
+    
+    # Both paths return (future of (collection, chunks added), progress)
+    return get_build_executor().submit(build), progress
 
-# CACHE AVAILABLE DOCUMENTS
-@st.cache_resource
+def build_and_load_database():
+    """Collection from get_database_build, with a progress status while it builds"""
+    # Not cached - st.status updates are not replayed on cached reruns
+    future, progress = get_database_build()
+    if not future.done():
+        with st.status("🔨 Building database from chunks...") as status:
+            while not future.done():
+                status.update(label=f"🔨 Building database from chunks... {progress['percent']}%")
+                wait([future], timeout=0.25)
+            if future.exception() is None:
+                status.update(label=f"✅ Database ready! Added {future.result()[1]} chunks", state="complete")
+            else:
+                status.update(label="❌ Database build failed", state="error")
+    if future.exception() is not None:
+        # Start a fresh build on the next rerun instead of caching the failure
+        get_database_build.clear()
+    return future.result()[0]
+
+# CACHE AVAILABLE DOCUMENTS - PLAIN DATA, NOT A LIVE RESOURCE
+@st.cache_data(ttl=3600)
 def get_available_documents():
-    """Extract list of unique documents from chunks.jsonl"""
-    documents = set()
+    """List of unique documents, read from the sources.json saved at build time"""
+    sources_path = "./chroma_data/sources.json"
     
+    # Use the saved list unless chunks.jsonl is newer (or it is all there is)
     try:
-        with open("chunks.jsonl", "r", encoding="utf-8") as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                chunk = json.loads(line)
-                source = chunk.get("metadata", {}).get("source", "Unknown")
-                documents.add(source)
-    except:
+        sources_mtime = os.stat(sources_path).st_mtime_ns
+    except FileNotFoundError:
+        sources_mtime = None
+    try:
+        chunks_mtime = os.stat("chunks.jsonl").st_mtime_ns
+    except FileNotFoundError:
+        chunks_mtime = None
+    if sources_mtime is not None and (chunks_mtime is None or sources_mtime >= chunks_mtime):
+        with open(sources_path, "rb") as f:
+            return orjson.loads(f.read())
+    
+    # Missing or stale sources.json - scan chunks.jsonl once and save
+    documents = set()
+    try:
+        srcs, = read_jsonl_columns("chunks.jsonl", "metadata.source")
+        documents = {str(src) for src in srcs if src not in (None, "")}
+        with open(sources_path, "wb") as f:
+            f.write(orjson.dumps(sorted(documents)))
+    except (OSError, ValueError):
+        # Unreadable chunks.jsonl (orjson.JSONDecodeError is a ValueError)
         pass
     
-    return sorted(list(documents))
+    return sorted(documents)
 
 # Load database
 try:
@@ -146,14 +375,170 @@ except KeyError:
     st.info("Go to Settings → Secrets and add: ANTHROPIC_API_KEY = \"sk-ant-...\"")
     st.stop()
 
+# CACHE API CLIENT - ONE CONNECTION POOL ACROSS RERUNS
+@st.cache_resource
+def get_anthropic_client(api_key: str):
+    """Anthropic client with a shared HTTP/2 connection pool"""
+    return anthropic.Anthropic(
+        api_key=api_key,
+        max_retries=2,
+        timeout=30.0,
+        http_client=httpx.Client(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=16, max_connections=32)
+        )
+    )
+
 # Initialize client
 try:
-    client = anthropic.Anthropic(api_key=api_key)
+    client = get_anthropic_client(api_key)
     st.write("✅ API connected!")
 except Exception as e:
     st.error(f"API Error: {str(e)}")
     st.stop()
 
+class QueryBatcher:
+    """Coalesce concurrent searches from all sessions into batched collection.query calls"""
+    
+    def __init__(self, collection, max_batch=16):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.pending = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def search(self, q, doc_filter, k, timeout=30.0):
+        future = Future()
+        self.pending.put((q, doc_filter, k, future))
+        return future.result(timeout=timeout)
+    
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            
+            groups = {}
+            for item in batch:
+                groups.setdefault((item[1], item[2]), []).append(item)
+            
+            for (doc_filter, k), items in groups.items():
+                # Failures go to the group's futures, the worker keeps running
+                try:
+                    results = self._query([item[0] for item in items], doc_filter, k)
+                    
+                    # An empty collection/filter can come back without per-query rows
+                    docs = results.get('documents') or [[] for _ in items]
+                    metas = results.get('metadatas') or [[] for _ in items]
+                    dists = results.get('distances') or [[] for _ in items]
+                    for item, item_docs, item_metas, item_dists in zip(items, docs, metas, dists):
+                        item[3].set_result((item_docs, item_metas, item_dists))
+                except Exception as e:
+                    for item in items:
+                        if not item[3].done():
+                            item[3].set_exception(e)
+    
+    def _query(self, texts, doc_filter, k):
+        # No embeddings to serialize - distances feed the relevance cutoff
+        include = ["documents", "metadatas", "distances"]
+        if doc_filter == "All Documents":
+            return self.collection.query(query_texts=texts, n_results=k, include=include)
+        # Equality filter on source is applied by Chroma during the search
+        return self.collection.query(query_texts=texts, n_results=k, where={"source": doc_filter}, include=include)
+
+@st.cache_resource
+def get_query_batcher(_collection):
+    """One batcher (and worker thread) per process"""
+    return QueryBatcher(_collection)
+
+# RELEVANCE CUTOFF - EXCERPTS AT OR ABOVE THIS COSINE DISTANCE STAY OUT OF THE PROMPT
+MAX_DISTANCE = 0.6
+
+def search(q: str, doc_filter: str, k: int) -> tuple[list[str], list[dict], int]:
+    """Top-k (documents, metadatas, number dropped by MAX_DISTANCE) for a question"""
+    docs, metas, dists = get_query_batcher(collection).search(q, doc_filter, k)
+    # Nearest first - the best match is always kept
+    keep = [i for i, dist in enumerate(dists) if i == 0 or dist < MAX_DISTANCE]
+    return [docs[i] for i in keep], [metas[i] for i in keep], len(docs) - len(keep)
+
+# CACHE ANSWERS - REPEAT QUESTIONS SKIP EMBEDDING, HNSW AND CLAUDE
+@st.cache_resource
+def get_answer_cache():
+    """Process-wide LRU of {(question, filter, k): (expires_at, answer, sources, dropped)} and its lock"""
+    return OrderedDict(), threading.Lock()
+
+def answer(q: str, filter_option: str, k: int = 3, max_entries: int = 512, ttl: int = 1800):
+    """(answer token stream, sources, excerpts dropped) for one question; the stream caches the answer once complete"""
+    cache, lock = get_answer_cache()
+    # Case/whitespace variants of a question share one entry
+    key = (" ".join(q.lower().split()), filter_option, k)
+    with lock:
+        hit = cache.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            cache.move_to_end(key)
+            return iter([hit[1]]), hit[2], hit[3]
+    
+    def store(text, sources, dropped):
+        with lock:
+            cache[key] = (time.monotonic() + ttl, text, sources, dropped)
+            cache.move_to_end(key)
+            if len(cache) > max_entries:
+                cache.popitem(last=False)
+    
+    # SEARCH DATABASE WITH OPTIONAL FILTERING
+    results_docs, results_metas, dropped = search(q, filter_option, k)
+    
+    if not results_docs:
+        if filter_option != "All Documents":
+            text = f"No relevant information found in '{filter_option}' about your question."
+        else:
+            text = "No relevant documents found for your question. Try asking about a different topic or select 'All Documents' to search broadly."
+        store(text, [], 0)
+        return iter([text]), [], 0
+    
+    # BUILD PROMPT WITH SOURCE TRACKING - pieces are joined once at the end
+    # instead of growing the context string per excerpt
+    parts = ["Based on the following document excerpts, answer the question accurately and comprehensively.\n\nDOCUMENTS:\n"]
+    sources = []
+    
+    for i, (doc, meta) in enumerate(zip(results_docs, results_metas), 1):
+        meta = meta or {}
+        source_name = meta.get('source', 'Unknown')
+        page_num = meta.get('page', 'Unknown')
+        doc_type = meta.get('type', 'text')
+        
+        parts.append(f"\n[Source {i}: {source_name} - Page {page_num} - {doc_type}]\n")
+        parts.append(doc)
+        parts.append("\n")
+        sources.append({
+            "source": source_name,
+            "page": page_num,
+            "type": doc_type
+        })
+    
+    parts.append("\n\nQUESTION: ")
+    parts.append(q)
+    parts.append("\n\nANSWER:")
+    prompt = "".join(parts)
+    
+    # CALL CLAUDE API
+    def stream():
+        with client.messages.stream(
+            model="claude-haiku-4-5-20251001",
+            max_tokens=1024,
+            messages=[{
+                "role": "user",
+                "content": prompt
+            }]
+        ) as response:
+            yield from response.text_stream
+            store(response.get_final_text(), sources, dropped)
+    
+    return stream(), sources, dropped
+
 # ========== SIDEBAR: DOCUMENT SELECTOR ==========
 with st.sidebar:
     st.header("📚 Available Documents")
@@ -179,6 +564,9 @@ with st.sidebar:
         st.warning("No documents loaded yet!")
         filter_option = "All Documents"
     
+    # RETRIEVAL DEPTH - more excerpts = better recall, longer prompts
+    n_results = st.slider("Excerpts per question:", 1, 10, 3, key="n_results")
+    
     st.divider()
     
     # INSTRUCTIONS
@@ -220,97 +608,33 @@ with col1:
     # USER INPUT
     if q := st.chat_input("Ask about the documents..."):
         st.session_state.messages.append({"role": "user", "content": q})
+        st.session_state.q_count += 1
         st.chat_message("user").write(q)
         
         with st.spinner("🔍 Searching documents..."):
             try:
-                # SEARCH DATABASE WITH OPTIONAL FILTERING
-                if filter_option != "All Documents":
-                    # Filter by selected document
-                    all_results = collection.query(query_texts=[q], n_results=10)
-                    
-                    # Filter results to only selected document
-                    filtered_docs = []
-                    filtered_metas = []
-                    
-                    for doc, meta in zip(all_results['documents'][0], all_results['metadatas'][0]):
-                        if meta.get('source') == filter_option:
-                            filtered_docs.append(doc)
-                            filtered_metas.append(meta)
-                            if len(filtered_docs) >= 3:
-                                break
-                    
-                    if not filtered_docs:
-                        answer = f"No relevant information found in '{filter_option}' about your question."
-                        sources = []
-                    else:
-                        results_docs = filtered_docs
-                        results_metas = filtered_metas
-                        found_results = True
-                else:
-                    # Search all documents
-                    results = collection.query(query_texts=[q], n_results=3)
-                    results_docs = results['documents'][0]
-                    results_metas = results['metadatas'][0]
-                    found_results = True
-                
-                if found_results and results_docs:
-                    # BUILD CONTEXT WITH SOURCE TRACKING
-                    context = ""
-                    sources = []
-                    
-                    for i, (doc, meta) in enumerate(zip(results_docs, results_metas), 1):
-                        source_name = meta.get('source', 'Unknown')
-                        page_num = meta.get('page', 'Unknown')
-                        doc_type = meta.get('type', 'text')
-                        
-                        context += f"\n[Source {i}: {source_name} - Page {page_num} - {doc_type}]\n{doc}\n"
-                        sources.append({
-                            "source": source_name,
-                            "page": page_num,
-                            "type": doc_type
-                        })
-                    
-                    # CALL CLAUDE API
-                    prompt = f"""Based on the following document excerpts, answer the question accurately and comprehensively.
-
-DOCUMENTS:
-{context}
-
-QUESTION: {q}
-
-ANSWER:"""
-                    
-                    response = client.messages.create(
-                        model="claude-haiku-4-5-20251001",
-                        max_tokens=1024,
-                        messages=[{
-                            "role": "user",
-                            "content": prompt
-                        }]
-                    )
-                    
-                    answer = response.content[0].text
-                else:
-                    answer = "No relevant documents found for your question. Try asking about a different topic or select 'All Documents' to search broadly."
-                    sources = []
+                answer_stream, sources, dropped = answer(q, filter_option, n_results)
                 
                 # DISPLAY ANSWER WITH SOURCES
                 with st.chat_message("assistant"):
-                    st.write(answer)
+                    # Tokens render as they arrive; returns the full text
+                    answer_text = st.write_stream(answer_stream)
                     if sources:
                         st.markdown("<div class='source-box'>", unsafe_allow_html=True)
                         st.write("**📄 Sources Used:**")
                         for source in sources:
                             st.write(f"• **{source['source']}** (Page {source['page']} - {source['type']})")
                         st.markdown("</div>", unsafe_allow_html=True)
+                    if dropped:
+                        st.caption(f"{dropped} less relevant excerpt(s) left out (cosine distance ≥ {MAX_DISTANCE})")
                 
                 # STORE IN HISTORY
                 st.session_state.messages.append({
                     "role": "assistant",
-                    "content": answer,
+                    "content": answer_text,
                     "sources": sources
                 })
+                st.session_state.recent_sources.append([source['source'] for source in sources])
                 
             except Exception as e:
                 st.error(f"Error: {str(e)}")
@@ -324,7 +648,7 @@ with col2:
         st.metric("Total Documents", len(available_docs))
     
     # Show query stats
-    q_count = len([m for m in st.session_state.messages if m["role"] == "user"])
+    q_count = st.session_state.q_count
     if q_count > 0:
         st.metric("Questions Asked", q_count)
         cost = q_count * 0.002
@@ -338,10 +662,8 @@ with col2:
     if st.session_state.messages:
         st.subheader("🔍 Recent Sources")
         recent_sources = set()
-        for msg in st.session_state.messages[-10:]:
-            if "sources" in msg:
-                for source in msg["sources"]:
-                    recent_sources.add(source['source'])
+        for names in st.session_state.recent_sources:
+            recent_sources.update(names)
         
         if recent_sources:
             for source in sorted(recent_sources):